@@ -4,8 +4,7 @@ import os
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Vercel's Python runtime serves a module-level WSGI callable named `app`
+# directly; a `handler` must be a BaseHTTPRequestHandler subclass, so the
+# Flask app is exported as-is rather than wrapped in a function.
 from streamlit_app import app
-
-def handler(request):
-    """Vercel serverless function handler"""
-    return app(request.environ, lambda status, headers: None)
\ No newline at end of file
@@ -1,12 +1,9 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
 import io
-import json
 from database import DatabaseManager
-from utils import format_bytes, get_column_stats, export_to_excel
+from utils import format_bytes, export_to_excel, export_to_json, export_to_parquet, is_numeric_data_type, is_text_data_type
 
 # Page configuration
 st.set_page_config(
@@ -16,14 +13,16 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize database managers
+# Initialize one database manager per connection for the whole process
 @st.cache_resource
-def init_database_custom():
-    return DatabaseManager(use_custom=True)
+def init_database(use_custom):
+    return DatabaseManager(use_custom=use_custom)
 
-@st.cache_resource  
-def init_database_replit():
-    return DatabaseManager(use_custom=False)
+# Ping the database at most every 30 seconds rather than on every rerun;
+# pool_pre_ping still checks each connection when it is checked out
+@st.cache_data(ttl=30, show_spinner=False)
+def check_connection(use_custom):
+    return init_database(use_custom=use_custom).test_connection()
 
 def main():
     st.title("🗄️ PostgreSQL Database Dumper")
@@ -39,16 +38,16 @@ def main():
     )
     
     # Initialize database connection based on choice
-    if db_choice == "Replit Database (Local)":
-        db_manager = init_database_replit()
-    else:
-        db_manager = init_database_custom()
+    use_custom = db_choice != "Replit Database (Local)"
+    db_manager = init_database(use_custom=use_custom)
     
     # Check connection status
     connection_params = db_manager.connection_params
     source = connection_params.get('source', 'unknown')
     
-    if not db_manager.test_connection():
+    if not check_connection(use_custom):
+        # Do not keep a failed check around; retry on the next rerun
+        check_connection.clear()
         st.error(f"❌ Failed to connect to {db_choice}. Please check your connection settings.")
         st.stop()
     
@@ -66,8 +65,8 @@ def main():
     # Sidebar for navigation
     st.sidebar.title("Navigation")
     
-    # Get all tables
-    tables = db_manager.get_all_tables()
+    # Get all tables, once per session
+    tables = get_session_tables(db_manager)
     
     if not tables:
         st.warning("No tables found in the database.")
@@ -76,18 +75,59 @@ def main():
     # Database overview section
     st.sidebar.subheader("Database Overview")
     st.sidebar.info(f"📊 Total Tables: {len(tables)}")
-    
+
+    if st.sidebar.button("🔄 Refresh Schema"):
+        # Drop cached table lists, column info and row counts
+        st.cache_data.clear()
+        clear_session_schema(db_manager)
+        st.rerun()
+
     # Table selection
     st.sidebar.subheader("Select Table")
     selected_table = st.sidebar.selectbox("Choose a table to explore:", tables)
     
     # Main content area
     if selected_table:
-        display_table_content(db_manager, selected_table)
+        table_fragment(db_manager, selected_table)
     
     # Database schema section
     st.sidebar.markdown("---")
     if st.sidebar.button("🔍 View Database Schema"):
+        schema_fragment(db_manager, tables)
+
+# The schema rarely changes, so the table list and column info are kept in the
+# session until the user refreshes them
+def get_session_tables(db_manager):
+    key = f"tables_{db_manager.cache_key}"
+    
+    # An empty list may be a failed query, so it is not kept
+    if not st.session_state.get(key):
+        st.session_state[key] = db_manager.get_all_tables()
+    
+    return st.session_state[key]
+
+def get_session_table_info(db_manager, table_name):
+    tables_info = st.session_state.setdefault(f"table_info_{db_manager.cache_key}", {})
+    
+    if not tables_info.get(table_name):
+        tables_info[table_name] = db_manager.get_table_info(table_name)
+    
+    return tables_info[table_name]
+
+def clear_session_schema(db_manager):
+    st.session_state.pop(f"tables_{db_manager.cache_key}", None)
+    st.session_state.pop(f"table_info_{db_manager.cache_key}", None)
+
+# Widgets inside a fragment rerun only that fragment, not the whole script,
+# and each fragment run uses one pooled connection for its queries
+@st.fragment
+def table_fragment(db_manager, table_name):
+    with db_manager.session():
+        display_table_content(db_manager, table_name)
+
+@st.fragment
+def schema_fragment(db_manager, tables):
+    with db_manager.session():
         display_database_schema(db_manager, tables)
 
 def display_table_content(db_manager, table_name):
@@ -99,11 +139,16 @@ def display_table_content(db_manager, table_name):
         st.header(f"📋 Table: {table_name}")
     
     # Get table info
-    table_info = db_manager.get_table_info(table_name)
-    row_count = db_manager.get_table_row_count(table_name)
+    table_info = get_session_table_info(db_manager, table_name)
     
     with col2:
-        st.metric("Total Rows", f"{row_count:,}")
+        # COUNT(*) scans the whole table, so only run it on request
+        if st.checkbox("Exact row count", value=False):
+            row_count = db_manager.get_table_row_count(table_name)
+            st.metric("Total Rows", f"{row_count:,}")
+        else:
+            row_count = db_manager.get_table_row_count_estimate(table_name)
+            st.metric("Total Rows (est.)", f"~{row_count:,}")
     with col3:
         st.metric("Columns", len(table_info))
     
@@ -115,33 +160,79 @@ def display_table_content(db_manager, table_name):
     # Data filtering and pagination controls
     st.subheader("🔧 Data Controls")
     
-    col1, col2, col3, col4 = st.columns(4)
+    col1, col2, col3 = st.columns(3)
     
     with col1:
         page_size = st.selectbox("Rows per page:", [10, 25, 50, 100, 500], index=2)
     
     with col2:
-        page_number = st.number_input("Page:", min_value=1, value=1, max_value=max(1, (row_count + page_size - 1) // page_size))
-    
-    with col3:
         refresh_data = st.button("🔄 Refresh Data")
     
-    with col4:
+    with col3:
         show_stats = st.checkbox("📊 Show Statistics", value=False)
     
-    # Search and filter
-    search_term = st.text_input("🔍 Search in all columns:")
-    
     # Column selection for filtering
     columns = [col['column_name'] for col in table_info]
+    column_types = {col['column_name']: col['data_type'] for col in table_info}
+    text_columns = [col for col in columns if is_text_data_type(column_types[col])]
+    
+    # Search and filter; searching a single text column lets the database use
+    # a trigram index, so that is the default. The form only reruns the query
+    # when the search is submitted
+    search_options = ["All columns"] + columns
+    default_search = search_options.index(text_columns[0]) if text_columns else 0
+    
+    with st.form("search_form"):
+        search_col1, search_col2 = st.columns([3, 1])
+        
+        with search_col1:
+            search_term = st.text_input("🔍 Search:")
+        
+        with search_col2:
+            search_choice = st.selectbox("Search in:", search_options, index=default_search)
+        
+        st.form_submit_button("Search")
+    
+    search_column = None if search_choice == "All columns" else search_choice
+    
+    if search_column in text_columns:
+        if st.button(f"⚡ Index {search_column} for search"):
+            if db_manager.ensure_search_index(table_name, search_column):
+                st.success(f"Trigram index on {search_column} is ready.")
+    
     selected_columns = st.multiselect("Select columns to display:", columns, default=columns)
     
     if not selected_columns:
         selected_columns = columns
     
+    numeric_columns = [col for col in selected_columns if is_numeric_data_type(column_types[col])]
+    
+    # Page with a single-column primary key when there is one, OFFSET otherwise
+    primary_keys = [col['column_name'] for col in table_info if col.get('is_primary_key')]
+    key_column = primary_keys[0] if len(primary_keys) == 1 else None
+    
+    pager = get_pager(db_manager, table_name, (page_size, search_term, search_column, tuple(selected_columns)))
+    cursor = pager['cursors'][-1]
+    
     # Get data with pagination
-    offset = (page_number - 1) * page_size
-    data = db_manager.get_table_data(table_name, limit=page_size, offset=offset, columns=selected_columns, search_term=search_term)
+    if key_column:
+        query_columns = selected_columns if key_column in selected_columns else [key_column] + selected_columns
+        data = db_manager.get_table_data(table_name, limit=page_size, columns=query_columns,
+                                         search_term=search_term, search_column=search_column,
+                                         order_by=key_column, after=cursor)
+    else:
+        data = db_manager.get_table_data(table_name, limit=page_size, offset=cursor or 0,
+                                         columns=selected_columns, search_term=search_term,
+                                         search_column=search_column)
+    
+    # A full page means there may be more rows after it
+    if data is not None and len(data) == page_size:
+        pager['next_cursor'] = data[key_column].tolist()[-1] if key_column else (cursor or 0) + page_size
+    else:
+        pager['next_cursor'] = None
+    
+    if data is not None and key_column and key_column not in selected_columns:
+        data = data.drop(columns=[key_column])
     
     if data is not None and not data.empty:
         # Display data statistics
@@ -149,21 +240,29 @@ def display_table_content(db_manager, table_name):
             st.subheader("📈 Data Statistics")
             stats_cols = st.columns(min(4, len(selected_columns)))
             
+            # Aggregates cover the whole table, not just the current page
+            column_stats = db_manager.get_column_stats_sql(table_name, selected_columns[:4])
+            
             for i, col in enumerate(selected_columns[:4]):
+                if col not in column_stats:
+                    continue
+                
                 with stats_cols[i % 4]:
-                    if data[col].dtype in ['int64', 'float64']:
-                        st.metric(f"{col} (Avg)", f"{data[col].mean():.2f}")
+                    value = column_stats[col]
+                    if col in numeric_columns:
+                        st.metric(f"{col} (Avg)", f"{float(value):.2f}" if value is not None else "N/A")
                     else:
-                        st.metric(f"{col} (Unique)", f"{data[col].nunique()}")
+                        st.metric(f"{col} (Unique)", f"{value:,}")
         
         # Data table display
         st.subheader("📊 Data Preview")
         st.dataframe(data, use_container_width=True, height=400)
+        display_pager(pager, row_count, page_size)
         
         # Export functionality
         st.subheader("💾 Export Data")
         
-        export_cols = st.columns(4)
+        export_cols = st.columns(5)
         
         with export_cols[0]:
             if st.button("📄 Export as CSV"):
@@ -177,7 +276,7 @@ def display_table_content(db_manager, table_name):
         
         with export_cols[1]:
             if st.button("📋 Export as JSON"):
-                json_data = data.to_json(orient='records', indent=2)
+                json_data = export_to_json(data)
                 st.download_button(
                     label="Download JSON",
                     data=json_data,
@@ -196,38 +295,101 @@ def display_table_content(db_manager, table_name):
                 )
         
         with export_cols[3]:
+            if st.button("📦 Export as Parquet"):
+                # Columnar and compressed; much smaller than CSV/JSON for large pages
+                parquet_data = export_to_parquet(data)
+                st.download_button(
+                    label="Download Parquet",
+                    data=parquet_data,
+                    file_name=f"{table_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet",
+                    mime="application/vnd.apache.parquet"
+                )
+        
+        with export_cols[4]:
             # Export all data (not just current page)
             if st.button("📁 Export Full Table"):
-                full_data = db_manager.get_table_data(table_name, columns=selected_columns)
-                if full_data is not None:
-                    csv_data = full_data.to_csv(index=False)
+                # Write CSV chunks straight from the cursor, without a DataFrame
+                csv_buffer = io.BytesIO()
+                try:
+                    for chunk in db_manager.iter_table_csv(table_name, columns=selected_columns):
+                        csv_buffer.write(chunk)
+                except Exception:
+                    # Already reported; don't offer a truncated file
+                    csv_buffer = None
+                
+                if csv_buffer is not None:
                     st.download_button(
                         label="Download Full CSV",
-                        data=csv_data,
+                        data=csv_buffer,
                         file_name=f"{table_name}_full_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                         mime="text/csv"
                     )
         
         # Data visualization for numeric columns
-        numeric_columns = data.select_dtypes(include=['int64', 'float64']).columns.tolist()
-        
         if numeric_columns and show_stats:
             st.subheader("📈 Data Visualization")
             
             viz_col = st.selectbox("Select column for visualization:", numeric_columns)
             
             if viz_col:
-                fig = px.histogram(data, x=viz_col, title=f"Distribution of {viz_col}")
-                st.plotly_chart(fig, use_container_width=True)
+                # Buckets are counted in the database over the whole table
+                histogram = db_manager.get_histogram(table_name, viz_col)
+                
+                if histogram is not None:
+                    st.plotly_chart(build_histogram(histogram, viz_col), use_container_width=True)
     
     else:
         st.warning("No data found for the selected criteria.")
+        display_pager(pager, row_count, page_size)
+
+def get_pager(db_manager, table_name, signature):
+    """Get the pagination state for a table, resetting it when the query changes
+    
+    The state holds a stack of page cursors: the last primary key value of the
+    previous page for keyset pagination, or the row offset otherwise.
+    """
+    key = f"pager_{db_manager.cache_key}_{table_name}"
+    pager = st.session_state.get(key)
+    
+    if pager is None or pager['signature'] != signature:
+        pager = {'signature': signature, 'cursors': [None], 'next_cursor': None}
+        st.session_state[key] = pager
+    
+    return pager
+
+def next_page(pager):
+    pager['cursors'].append(pager['next_cursor'])
+
+def previous_page(pager):
+    if len(pager['cursors']) > 1:
+        pager['cursors'].pop()
+
+def display_pager(pager, row_count, page_size):
+    """Display Previous/Next page controls"""
+    page_number = len(pager['cursors'])
+    total_pages = max(1, (row_count + page_size - 1) // page_size)
+    
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    
+    with prev_col:
+        st.button("⬅️ Previous", on_click=previous_page, args=(pager,), disabled=page_number == 1)
+    
+    with page_col:
+        st.caption(f"Page {page_number} of {total_pages:,}")
+    
+    with next_col:
+        st.button("Next ➡️", on_click=next_page, args=(pager,), disabled=pager['next_cursor'] is None)
 
 def display_database_schema(db_manager, tables):
     """Display complete database schema information"""
     
     st.header("🏗️ Database Schema Overview")
     
+    # Fetch metadata for all tables up front instead of querying per table
+    tables_info = db_manager.get_all_tables_info()
+    table_stats = db_manager.get_all_table_stats()
+    row_counts = {table: stats['row_count'] for table, stats in table_stats.items()}
+    
     # Create tabs for different schema views
     tab1, tab2, tab3 = st.tabs(["📋 All Tables", "🔗 Relationships", "📊 Statistics"])
     
@@ -236,18 +398,18 @@ def display_database_schema(db_manager, tables):
         
         schema_data = []
         for table in tables:
-            table_info = db_manager.get_table_info(table)
-            row_count = db_manager.get_table_row_count(table)
+            table_info = tables_info.get(table, [])
             
             schema_data.append({
                 'Table Name': table,
                 'Column Count': len(table_info),
-                'Row Count': row_count,
+                'Row Count': row_counts.get(table, 0),
                 'Primary Keys': ', '.join([col['column_name'] for col in table_info if col.get('is_primary_key', False)]),
-                'Estimated Size': format_bytes(row_count * len(table_info) * 50)  # Rough estimate
+                'Total Size': table_stats.get(table, {}).get('total_bytes', 0)
             })
         
         schema_df = pd.DataFrame(schema_data)
+        schema_df['Total Size'] = schema_df['Total Size'].map(format_bytes)
         st.dataframe(schema_df, use_container_width=True)
     
     with tab2:
@@ -263,8 +425,8 @@ def display_database_schema(db_manager, tables):
     with tab3:
         st.subheader("Database Statistics")
         
-        total_rows = sum(db_manager.get_table_row_count(table) for table in tables)
-        total_columns = sum(len(db_manager.get_table_info(table)) for table in tables)
+        total_rows = sum(row_counts.get(table, 0) for table in tables)
+        total_columns = sum(len(tables_info.get(table, [])) for table in tables)
         
         stat_cols = st.columns(4)
         
@@ -281,13 +443,33 @@ def display_database_schema(db_manager, tables):
         if tables:
             table_sizes = []
             for table in tables:
-                row_count = db_manager.get_table_row_count(table)
-                table_sizes.append({'Table': table, 'Row Count': row_count})
+                table_sizes.append({'Table': table, 'Row Count': row_counts.get(table, 0)})
             
             size_df = pd.DataFrame(table_sizes)
-            fig = px.bar(size_df, x='Table', y='Row Count', title='Table Sizes by Row Count')
-            fig.update_xaxes(tickangle=45)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(build_size_bar(size_df), use_container_width=True)
+
+# Figures are rebuilt only when their input data changes
+@st.cache_data(ttl="10m", max_entries=50, show_spinner=False)
+def build_histogram(histogram, column):
+    """Build a bar chart from a bucketed column distribution"""
+    import plotly.express as px
+    
+    fig = px.bar(
+        histogram, x='bucket_start', y='frequency',
+        labels={'bucket_start': column, 'frequency': 'count'},
+        title=f"Distribution of {column}"
+    )
+    fig.update_layout(bargap=0)
+    return fig
+
+@st.cache_data(ttl="10m", max_entries=50, show_spinner=False)
+def build_size_bar(size_df):
+    """Build the table size bar chart"""
+    import plotly.express as px
+    
+    fig = px.bar(size_df, x='Table', y='Row Count', title='Table Sizes by Row Count')
+    fig.update_xaxes(tickangle=45)
+    return fig
 
 if __name__ == "__main__":
     main()
@@ -4,199 +4,135 @@
 Alternative web interface for Vercel deployment using Flask
 """
 
-from flask import Flask, render_template_string, request, jsonify, send_file
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+try:
+    from gevent import monkey
+except ImportError:
+    monkey = None
+
+if monkey is not None and monkey.is_module_patched('socket'):
+    # Running under gunicorn's gevent worker (see Procfile): let psycopg2 yield
+    # to other greenlets while it waits on the database
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+from flask import Flask, Response, make_response, render_template, request, jsonify, send_file, stream_with_context
+from flask_compress import Compress
+from werkzeug.datastructures import Headers
+from collections import OrderedDict
 from datetime import datetime
+from urllib.parse import quote
+import hashlib
 import io
-import json
+import threading
+import time
+import unicodedata
 from database import DatabaseManager
-from utils import export_to_excel
+from utils import downcast_dataframe, dumps_json, export_frames_to_excel, export_frames_to_parquet, iter_json
 
 app = Flask(__name__)
 
-# HTML template for the web interface
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>PostgreSQL Database Dumper</title>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
-    <style>
-        .container-fluid { padding: 20px; }
-        .table-container { max-height: 600px; overflow-y: auto; }
-        .stats-card { margin: 10px 0; }
-    </style>
-</head>
-<body>
-    <div class="container-fluid">
-        <h1 class="mb-4">🗄️ PostgreSQL Database Dumper</h1>
-        
-        <div class="row">
-            <div class="col-md-3">
-                <div class="card">
-                    <div class="card-header">
-                        <h5>Database Selection</h5>
-                    </div>
-                    <div class="card-body">
-                        <div class="form-check">
-                            <input class="form-check-input" type="radio" name="dbType" id="reviewpilot" value="custom" checked>
-                            <label class="form-check-label" for="reviewpilot">
-                                ReviewPilot Database
-                            </label>
-                        </div>
-                        <div class="form-check">
-                            <input class="form-check-input" type="radio" name="dbType" id="replit" value="replit">
-                            <label class="form-check-label" for="replit">
-                                Replit Database
-                            </label>
-                        </div>
-                        <button class="btn btn-primary mt-3" onclick="connectDatabase()">Connect</button>
-                    </div>
-                </div>
-                
-                <div class="card mt-3" id="tablesCard" style="display: none;">
-                    <div class="card-header">
-                        <h5>Tables</h5>
-                    </div>
-                    <div class="card-body">
-                        <select class="form-select" id="tableSelect" onchange="loadTable()">
-                            <option value="">Select a table...</option>
-                        </select>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="col-md-9">
-                <div id="connectionStatus"></div>
-                <div id="tableContent"></div>
-            </div>
-        </div>
-    </div>
+# flask-compress buffers a streamed response whole before compressing it, which
+# would undo the row-by-row CSV/JSON exports; only compress regular responses.
+app.config['COMPRESS_STREAMS'] = False
+Compress(app)
 
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
-    <script>
-        let currentDbType = 'custom';
-        
-        function connectDatabase() {
-            const dbType = document.querySelector('input[name="dbType"]:checked').value;
-            currentDbType = dbType;
-            
-            fetch('/connect', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({db_type: dbType})
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    document.getElementById('connectionStatus').innerHTML = 
-                        '<div class="alert alert-success">✅ Connected to ' + data.db_info.source + '</div>';
-                    loadTables(data.tables);
-                    document.getElementById('tablesCard').style.display = 'block';
-                } else {
-                    document.getElementById('connectionStatus').innerHTML = 
-                        '<div class="alert alert-danger">❌ Connection failed: ' + data.error + '</div>';
-                }
-            })
-            .catch(error => {
-                document.getElementById('connectionStatus').innerHTML = 
-                    '<div class="alert alert-danger">❌ Error: ' + error + '</div>';
-            });
-        }
-        
-        function loadTables(tables) {
-            const select = document.getElementById('tableSelect');
-            select.innerHTML = '<option value="">Select a table...</option>';
-            tables.forEach(table => {
-                const option = document.createElement('option');
-                option.value = table;
-                option.textContent = table;
-                select.appendChild(option);
-            });
-        }
-        
-        function loadTable() {
-            const tableName = document.getElementById('tableSelect').value;
-            if (!tableName) return;
-            
-            fetch('/table_data', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({table_name: tableName, db_type: currentDbType, limit: 50})
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    displayTableData(data.data, data.info, tableName);
-                } else {
-                    document.getElementById('tableContent').innerHTML = 
-                        '<div class="alert alert-danger">Error loading table: ' + data.error + '</div>';
-                }
-            });
-        }
-        
-        function displayTableData(data, info, tableName) {
-            let html = '<div class="card"><div class="card-header"><h5>Table: ' + tableName + '</h5>';
-            html += '<p>Rows: ' + info.row_count + ' | Columns: ' + info.column_count + '</p></div>';
-            html += '<div class="card-body"><div class="table-container">';
-            
-            if (data.length > 0) {
-                html += '<table class="table table-striped table-hover"><thead class="table-dark"><tr>';
-                Object.keys(data[0]).forEach(col => {
-                    html += '<th>' + col + '</th>';
-                });
-                html += '</tr></thead><tbody>';
-                
-                data.forEach(row => {
-                    html += '<tr>';
-                    Object.values(row).forEach(val => {
-                        html += '<td>' + (val || '') + '</td>';
-                    });
-                    html += '</tr>';
-                });
-                html += '</tbody></table>';
-            } else {
-                html += '<p>No data found in this table.</p>';
-            }
-            
-            html += '</div><div class="mt-3">';
-            html += '<button class="btn btn-success me-2" onclick="exportData(\'' + tableName + '\', \'csv\')">Export CSV</button>';
-            html += '<button class="btn btn-info me-2" onclick="exportData(\'' + tableName + '\', \'json\')">Export JSON</button>';
-            html += '<button class="btn btn-warning" onclick="exportData(\'' + tableName + '\', \'excel\')">Export Excel</button>';
-            html += '</div></div></div>';
-            
-            document.getElementById('tableContent').innerHTML = html;
-        }
-        
-        function exportData(tableName, format) {
-            const url = '/export/' + format + '/' + tableName + '?db_type=' + currentDbType;
-            window.open(url, '_blank');
-        }
-        
-        // Auto-connect on page load
-        connectDatabase();
-    </script>
-</body>
-</html>
-"""
+# One DatabaseManager (and so one connection pool) per database for the whole process
+_db_managers = {}
+_db_managers_lock = threading.Lock()
+
+# Rows read per chunk when exporting a whole table
+EXPORT_CHUNK_SIZE = 50_000
+
+# Largest page /table_data serves; DataTables asks for length -1 to mean "all rows"
+MAX_PAGE_SIZE = 1000
+
+# Recently fetched query results, keyed by the query arguments, in LRU order
+QUERY_CACHE_TTL = 30
+QUERY_CACHE_SIZE = 32
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+def get_manager(db_type):
+    """Get the shared DatabaseManager for a database type"""
+    use_custom = db_type == 'custom'
+    
+    with _db_managers_lock:
+        if use_custom not in _db_managers:
+            _db_managers[use_custom] = DatabaseManager(use_custom=use_custom)
+        return _db_managers[use_custom]
+
+def _get_cached(key, fetch):
+    """Return the cached result for key, calling fetch() when it is missing or stale
+    
+    Results younger than QUERY_CACHE_TTL seconds are reused; None is never cached.
+    """
+    now = time.monotonic()
+    
+    with _query_cache_lock:
+        entry = _query_cache.get(key)
+        if entry is not None and now - entry[0] < QUERY_CACHE_TTL:
+            _query_cache.move_to_end(key)
+            return entry[1]
+    
+    result = fetch()
+    
+    if result is not None:
+        with _query_cache_lock:
+            _query_cache[key] = (now, result)
+            _query_cache.move_to_end(key)
+            while len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    
+    return result
+
+def get_cached_table_page(db_type, table_name, limit, offset=0, search_term=None, order_by=None, after=None,
+                          version=None):
+    """Get a (DataFrame, matching row count) page through the query cache, or None on error
+    
+    Passing the table's version keeps a changed table from being served from the cache.
+    """
+    def fetch():
+        table_data, total = get_manager(db_type).get_table_page(table_name, limit=limit, offset=offset,
+                                                                search_term=search_term,
+                                                                order_by=order_by, after=after,
+                                                                version=version)
+        return (downcast_dataframe(table_data), total) if table_data is not None else None
+    
+    return _get_cached(('page', db_type, table_name, limit, offset, search_term, order_by, after, version), fetch)
+
+def _attachment_headers(filename):
+    """Build a Content-Disposition header for a streamed download, as send_file does
+    
+    The filename is quoted, and a non-ASCII name also gets an RFC 5987
+    filename* with an ASCII fallback for older clients.
+    """
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+-.^_`|~')}"}
+    else:
+        names = {'filename': filename}
+    
+    headers = Headers()
+    headers.set('Content-Disposition', 'attachment', **names)
+    return headers
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    # The page is static, so browsers may cache it and revalidate with the ETag
+    response = make_response(render_template('index.html'))
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/connect', methods=['POST'])
 def connect_database():
     try:
         data = request.get_json()
         db_type = data.get('db_type', 'custom')
-        use_custom = db_type == 'custom'
-        
-        db_manager = DatabaseManager(use_custom=use_custom)
+        db_manager = get_manager(db_type)
         
         if not db_manager.test_connection():
             return jsonify({'success': False, 'error': 'Database connection failed'})
@@ -211,75 +147,164 @@ def connect_database():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/table_data', methods=['POST'])
-def get_table_data():
+@app.route('/table_columns', methods=['POST'])
+def get_table_columns():
     try:
         data = request.get_json()
         table_name = data.get('table_name')
         db_type = data.get('db_type', 'custom')
-        limit = data.get('limit', 50)
-        
-        use_custom = db_type == 'custom'
-        db_manager = DatabaseManager(use_custom=use_custom)
         
-        table_data = db_manager.get_table_data(table_name, limit=limit)
-        table_info = db_manager.get_table_info(table_name)
-        row_count = db_manager.get_table_row_count(table_name)
+        table_info = get_manager(db_type).get_table_info(table_name)
         
-        if table_data is not None:
-            data_dict = table_data.to_dict('records')
+        if table_info:
             return jsonify({
                 'success': True,
-                'data': data_dict,
-                'info': {
-                    'row_count': row_count,
-                    'column_count': len(table_info)
-                }
+                'columns': [col['column_name'] for col in table_info]
             })
         else:
-            return jsonify({'success': False, 'error': 'Failed to load table data'})
+            return jsonify({'success': False, 'error': 'Failed to load table columns'})
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+def _datatables_json(draw, payload):
+    """Add the request's draw counter to a /table_data payload, when it sent one
+    
+    The page itself sends no draw, so its URL (and so its ETag) stays the same
+    between views; DataTables only checks draw when it is present.
+    """
+    if draw is not None:
+        payload = dict(payload, draw=draw)
+    return payload
+
+@app.route('/table_data')
+def get_table_data():
+    """Serve one page of rows using the DataTables server-side processing protocol
+    
+    Served over GET with an ETag built from the table's version and the
+    request's arguments, so a browser revalidating an unchanged page gets a
+    304 without the page being queried or serialized.
+    """
+    data = request.args
+    
+    # A malformed draw is ignored rather than failing the request outside
+    # the protocol's error response
+    try:
+        draw = int(data['draw']) if 'draw' in data else None
+    except ValueError:
+        draw = 0
+    
+    try:
+        table_name = data.get('table_name')
+        db_type = data.get('db_type', 'custom')
+        start = max(int(data.get('start', 0)), 0)
+        length = int(data.get('length', 50))
+        search_term = data.get('search') or None
+        # Last key of the previous page, sent when paging forward
+        after = data.get('after')
+        
+        if length < 0 or length > MAX_PAGE_SIZE:
+            length = MAX_PAGE_SIZE
+        
+        db_manager = get_manager(db_type)
+        
+        # Order by the primary key so pages are stable, and seek past the
+        # previous page's last key rather than scanning OFFSET rows
+        key_column = db_manager.get_primary_key(table_name)
+        if key_column is None:
+            after = None
+        
+        # A change to the table changes its version, so neither a cached page
+        # nor a cached row count of the old contents is served, and the ETag
+        # changes with it
+        version = db_manager.get_table_version(table_name)
+        etag = None
+        if version is not None:
+            page_key = (version, sorted(data.items(multi=True)))
+            etag = hashlib.sha1(repr(page_key).encode()).hexdigest()
+            
+            # flask-compress suffixes the ETag of a compressed response with ":gzip"
+            if etag in {tag.split(':', 1)[0] for tag in request.if_none_match.as_set()}:
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+        
+        # Row counts are cached per version, and a search's count per search
+        # term, so paging through results does not count them again
+        page = get_cached_table_page(db_type, table_name, length, offset=start, search_term=search_term,
+                                     order_by=key_column, after=after, version=version)
+        
+        if page is None:
+            return jsonify(_datatables_json(draw, {'error': 'Failed to load table data'}))
+        
+        table_data, filtered_count = page
+        row_count = db_manager.get_table_row_count(table_name, version) if search_term else filtered_count
+        
+        # Rows go out as arrays in column order; missing values become null
+        rows = table_data.astype(object).where(table_data.notna(), None).values.tolist()
+        
+        # Integer and text keys can seek the next page. The key goes out as a
+        # string, since JavaScript numbers lose bigint precision above 2**53;
+        # PostgreSQL casts it back to the key's type in the comparison
+        last_key = None
+        if key_column is not None and not table_data.empty:
+            last_key = table_data[key_column].iloc[-1]
+            last_key = last_key.item() if hasattr(last_key, 'item') else last_key
+            if isinstance(last_key, (int, str)) and not isinstance(last_key, bool):
+                last_key = str(last_key)
+            else:
+                last_key = None
+        
+        # Serialized with orjson: the page is the hot path, and dates come out as ISO 8601
+        response = Response(dumps_json(_datatables_json(draw, {
+            'recordsTotal': row_count,
+            'recordsFiltered': filtered_count,
+            'data': rows,
+            'last_key': last_key
+        })), mimetype='application/json')
+        
+        # no-cache: the browser keeps the page but revalidates it on every view
+        if etag is not None:
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+        
+        return response.make_conditional(request)
+            
+    except Exception as e:
+        return jsonify(_datatables_json(draw, {'error': str(e)}))
+
 @app.route('/export/<format>/<table_name>')
 def export_data(format, table_name):
     try:
         db_type = request.args.get('db_type', 'custom')
-        use_custom = db_type == 'custom'
-        db_manager = DatabaseManager(use_custom=use_custom)
+        db_manager = get_manager(db_type)
         
-        table_data = db_manager.get_table_data(table_name)
-        
-        if table_data is None:
-            return "Error: Could not retrieve table data", 500
+        # The export streams once headers are sent, so check the table first
+        if table_name not in db_manager.get_all_tables():
+            return "Error: Could not retrieve table data", 404
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
+        # Exports cover the whole table, read in chunks through a server-side cursor
         if format == 'csv':
-            output = io.StringIO()
-            table_data.to_csv(output, index=False)
-            output.seek(0)
-            
-            return send_file(
-                io.BytesIO(output.getvalue().encode()),
+            return Response(
+                stream_with_context(db_manager.iter_table_csv(table_name, chunk_size=EXPORT_CHUNK_SIZE)),
                 mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'{table_name}_{timestamp}.csv'
+                headers=_attachment_headers(f'{table_name}_{timestamp}.csv')
             )
             
         elif format == 'json':
-            json_data = table_data.to_json(orient='records', indent=2)
+            chunks = db_manager.iter_table_data(table_name, chunksize=EXPORT_CHUNK_SIZE)
             
-            return send_file(
-                io.BytesIO(json_data.encode()),
+            return Response(
+                stream_with_context(iter_json(chunks)),
                 mimetype='application/json',
-                as_attachment=True,
-                download_name=f'{table_name}_{timestamp}.json'
+                headers=_attachment_headers(f'{table_name}_{timestamp}.json')
             )
             
         elif format == 'excel':
-            excel_data = export_to_excel(table_data, table_name)
+            chunks = db_manager.iter_table_data(table_name, chunksize=EXPORT_CHUNK_SIZE)
+            excel_data = export_frames_to_excel(chunks, table_name)
             
             return send_file(
                 io.BytesIO(excel_data),
@@ -287,6 +312,21 @@ def export_data(format, table_name):
                 as_attachment=True,
                 download_name=f'{table_name}_{timestamp}.xlsx'
             )
+            
+        elif format == 'parquet':
+            chunks = db_manager.iter_table_data(table_name, chunksize=EXPORT_CHUNK_SIZE)
+            try:
+                parquet_data = export_frames_to_parquet(chunks)
+            except ImportError:
+                # The Vercel build does not install pyarrow
+                return "Parquet export is not available on this deployment", 501
+            
+            return send_file(
+                io.BytesIO(parquet_data),
+                mimetype='application/vnd.apache.parquet',
+                as_attachment=True,
+                download_name=f'{table_name}_{timestamp}.parquet'
+            )
         
         return "Unsupported format", 400
         
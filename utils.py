@@ -1,21 +1,30 @@
 import pandas as pd
+import datetime
+import decimal
 import io
-from typing import Dict, Any, List
-import streamlit as st
+import math
+import re
+import orjson
+from typing import TYPE_CHECKING, Dict, Any, Iterable, Iterator, List
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+_BYTE_UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
 
 def format_bytes(bytes_value):
     """Convert bytes to human readable format"""
-    if bytes_value == 0:
+    if not bytes_value:
         return "0 B"
     
-    size_names = ["B", "KB", "MB", "GB", "TB"]
-    size_index = 0
+    # NaN and infinity have no bit length
+    if not math.isfinite(bytes_value):
+        return f"{bytes_value} B"
     
-    while bytes_value >= 1024 and size_index < len(size_names) - 1:
-        bytes_value /= 1024.0
-        size_index += 1
+    # Each unit is 2**10 of the previous one, so the bit length picks the unit
+    size_index = min(len(_BYTE_UNITS) - 1, max(0, int(bytes_value).bit_length() - 1) // 10)
     
-    return f"{bytes_value:.2f} {size_names[size_index]}"
+    return f"{bytes_value / (1 << (size_index * 10)):.2f} {_BYTE_UNITS[size_index]}"
 
 def get_column_stats(df: pd.DataFrame, column: str) -> Dict[str, Any]:
     """Get statistics for a specific column"""
@@ -24,66 +33,294 @@ def get_column_stats(df: pd.DataFrame, column: str) -> Dict[str, Any]:
     
     # Basic stats
     stats['count'] = len(col_data)
-    stats['null_count'] = col_data.isnull().sum()
+    stats['null_count'] = stats['count'] - col_data.count()
     stats['unique_count'] = col_data.nunique()
     
     # Type-specific stats
     if pd.api.types.is_numeric_dtype(col_data):
+        # min and max keep the column's type; agg() would upcast them to float with the mean
         stats['min'] = col_data.min()
         stats['max'] = col_data.max()
         stats['mean'] = col_data.mean()
         stats['median'] = col_data.median()
         stats['std'] = col_data.std()
     elif pd.api.types.is_string_dtype(col_data):
-        stats['min_length'] = col_data.str.len().min()
-        stats['max_length'] = col_data.str.len().max()
-        stats['avg_length'] = col_data.str.len().mean()
+        lengths = col_data.str.len()
+        stats['min_length'] = lengths.min()
+        stats['max_length'] = lengths.max()
+        stats['avg_length'] = lengths.mean()
     
     return stats
 
+def _binary_text(value) -> str:
+    """Render bytea (bytes or the memoryview psycopg2 returns) in PostgreSQL's hex format"""
+    return '\\x' + bytes(value).hex()
+
+_EXCEL_DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Values XlsxWriter writes natively; anything else (json, bytea, UUID) is written as text
+_EXCEL_NATIVE_TYPES = (str, int, float, decimal.Decimal, datetime.date, datetime.time, datetime.timedelta)
+
+def _excel_value(value):
+    """Convert a cell value XlsxWriter cannot write to its string form"""
+    if value is None or isinstance(value, _EXCEL_NATIVE_TYPES):
+        return value
+    if isinstance(value, (bytes, memoryview)):
+        return _binary_text(value)
+    return str(value)
+
+# Characters Excel does not allow in a sheet name, which is at most 31 characters
+_EXCEL_SHEET_NAME_INVALID = re.compile(r'[\[\]:*?/\\]')
+
+def _excel_sheet_name(name: str) -> str:
+    """Make a table name usable as an Excel sheet name, falling back to Data"""
+    name = _EXCEL_SHEET_NAME_INVALID.sub('', str(name))[:31]
+    # Excel also rejects names starting or ending with an apostrophe
+    name = name.strip("'")
+    return name or "Data"
+
+def _is_timestamp_column(col_data: pd.Series) -> bool:
+    """Check for a datetime column, including Arrow timestamps (not covered by pandas 2.3)"""
+    if pd.api.types.is_datetime64_any_dtype(col_data):
+        return True
+    if isinstance(col_data.dtype, pd.ArrowDtype):
+        import pyarrow as pa
+        return pa.types.is_timestamp(col_data.dtype.pyarrow_dtype)
+    return False
+
+def _column_widths(df: pd.DataFrame) -> List[int]:
+    """Excel column widths fitting each column's header and longest value, capped at 50"""
+    widths = []
+    
+    for column, col_data in df.items():
+        max_length = len(str(column))
+        
+        if col_data.empty:
+            pass
+        elif pd.api.types.is_integer_dtype(col_data):
+            # No integer between the extremes has more digits than they do
+            max_length = max(max_length, len(str(col_data.min())), len(str(col_data.max())))
+        elif pd.api.types.is_float_dtype(col_data):
+            # Floats in between can carry more digits, so size for the extremes at
+            # the 6 significant digits of :g; longer values are shown rounded
+            max_length = max(max_length, len(f"{col_data.min():g}"), len(f"{col_data.max():g}"))
+        elif _is_timestamp_column(col_data):
+            max_length = max(max_length, len(_EXCEL_DATE_FORMAT))
+        else:
+            longest = col_data.astype(str).str.len().max()
+            if pd.notna(longest):
+                max_length = max(max_length, int(longest))
+        
+        widths.append(min(max_length + 2, 50))
+    
+    return widths
+
 def export_to_excel(df: pd.DataFrame, sheet_name: str = "Data") -> bytes:
     """Export DataFrame to Excel format and return as bytes"""
+    return export_frames_to_excel([df], sheet_name)
+
+def export_frames_to_excel(frames: Iterable[pd.DataFrame], sheet_name: str = "Data") -> bytes:
+    """Export a sequence of DataFrame chunks to one Excel sheet and return as bytes
+    
+    Column widths are sized from the first chunk. Rows past Excel's limit of
+    1,048,576 per sheet are dropped.
+    """
+    # Imported here so only an export pays for loading the Excel writer
+    import xlsxwriter
+    
     output = io.BytesIO()
     
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
+    # constant_memory flushes each row to disk once it is complete, so rows
+    # are written in order here; pandas' to_excel writes column by column.
+    # Infinity (valid in float and numeric columns) is written as an error
+    # cell, since Excel numbers cannot hold it
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'nan_inf_to_errors': True,
+        'remove_timezone': True,
+        'default_date_format': _EXCEL_DATE_FORMAT,
+    })
+    worksheet = workbook.add_worksheet(_excel_sheet_name(sheet_name))
+    
+    row_idx = 0
+    for df in frames:
+        if row_idx == 0:
+            # Auto-adjust columns width
+            for col_idx, width in enumerate(_column_widths(df)):
+                worksheet.set_column(col_idx, col_idx, width)
+            
+            worksheet.write_row(0, 0, [str(column) for column in df.columns], workbook.add_format({'bold': True}))
+            row_idx = 1
         
-        # Get the workbook and worksheet
-        workbook = writer.book
-        worksheet = writer.sheets[sheet_name]
+        values = df.astype(object)
         
-        # Auto-adjust columns width
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            
-            adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
+        # Only object columns can hold types XlsxWriter rejects
+        for position in range(df.shape[1]):
+            if df.dtypes.iloc[position] == object:
+                converted = [_excel_value(value) for value in values.iloc[:, position]]
+                values.isetitem(position, pd.Series(converted, index=values.index, dtype=object))
+        
+        values = values.where(df.notna(), None)
+        
+        for row in values.itertuples(index=False, name=None):
+            worksheet.write_row(row_idx, 0, row)
+            row_idx += 1
     
-    output.seek(0)
+    workbook.close()
     return output.getvalue()
 
-def validate_sql_query(query: str) -> bool:
-    """Basic SQL query validation (prevent dangerous operations)"""
-    dangerous_keywords = [
-        'DROP', 'DELETE', 'TRUNCATE', 'ALTER', 'CREATE', 
-        'INSERT', 'UPDATE', 'GRANT', 'REVOKE'
-    ]
+def _json_default(value):
+    """Serialize the values orjson has no native support for"""
+    if value is pd.NaT:
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (bytes, memoryview)):
+        return _binary_text(value)
+    return str(value)
+
+def dumps_json(value) -> bytes:
+    """Serialize a value to JSON bytes with orjson
     
-    query_upper = query.upper().strip()
+    Timestamps, dates and times become ISO 8601 strings (naive ones without
+    an offset, as pandas writes them) and NaT null;
+    other values orjson does not know (Decimal, UUID, bytea) become strings.
+    """
+    return orjson.dumps(value, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def export_to_json(df: pd.DataFrame) -> bytes:
+    """Export DataFrame to JSON (see iter_json for the layout) and return as bytes"""
+    return b''.join(iter_json([df]))
+
+def iter_json(frames: Iterable[pd.DataFrame]) -> Iterator[bytes]:
+    """Yield a sequence of DataFrame chunks as one JSON document
     
-    for keyword in dangerous_keywords:
-        if keyword in query_upper:
-            return False
+    The layout is pandas' split orient without the index,
+    {"columns": [...], "data": [[...], ...]}, so column names are written
+    once instead of in every row.
+    """
+    columns = None
+    first = True
     
-    return True
+    for df in frames:
+        if columns is None:
+            columns = [str(column) for column in df.columns]
+            yield b'{"columns":' + dumps_json(columns) + b',"data":['
+        
+        if df.empty:
+            continue
+        
+        # Each chunk is serialized as an array; drop its brackets to splice it in
+        rows = dumps_json(df.astype(object).where(df.notna(), None).values.tolist())[1:-1]
+        yield rows if first else b',' + rows
+        first = False
+    
+    if columns is None:
+        yield b'{"columns":[],"data":['
+    
+    yield b']}'
+
+# Object columns whose values Arrow stores as plain scalars; anything else
+# (json dicts and lists, mixed values) would become structs or fail
+_ARROW_SCALAR_TYPES = {'string', 'integer', 'floating', 'boolean', 'date', 'datetime', 'decimal', 'empty'}
+
+def _is_arrow_scalar(col_data: pd.Series) -> bool:
+    """Check whether a column can move to Arrow without changing its values"""
+    return col_data.dtype != object or pd.api.types.infer_dtype(col_data, skipna=True) in _ARROW_SCALAR_TYPES
+
+def to_arrow_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Move a DataFrame's scalar columns onto pyarrow-backed dtypes
+    
+    Strings become contiguous UTF-8 buffers and nulls a bitmap, which is much
+    smaller than Python objects. Columns holding json values stay as objects.
+    pyarrow is optional (the Vercel build leaves it out to stay under the
+    bundle size limit); without it the DataFrame is returned unchanged.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return df
+    
+    df = df.copy()
+    
+    for position in range(df.shape[1]):
+        col_data = df.iloc[:, position]
+        if isinstance(col_data.dtype, pd.ArrowDtype) or not _is_arrow_scalar(col_data):
+            continue
+        
+        # TypeError covers pa.ArrowTypeError and the plain TypeError pyarrow
+        # raises for values such as Decimal('Infinity') from numeric columns
+        try:
+            arrow_data = pa.array(col_data, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, TypeError):
+            continue
+        
+        df.isetitem(position, pd.Series(pd.arrays.ArrowExtensionArray(arrow_data), index=df.index))
+    
+    return df
+
+def _as_text(value):
+    """Render a value for a text column: json values as JSON, missing values as null"""
+    if isinstance(value, (dict, list)):
+        return dumps_json(value).decode()
+    if isinstance(value, (bytes, memoryview)):
+        return _binary_text(value)
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    return str(value)
+
+def _arrow_table(df: pd.DataFrame) -> 'pa.Table':
+    """Convert a DataFrame to an Arrow table, storing json and mixed values as text"""
+    import pyarrow as pa
+    
+    arrays = []
+    
+    for position in range(df.shape[1]):
+        col_data = df.iloc[:, position]
+        arrow_data = None
+        
+        if _is_arrow_scalar(col_data):
+            try:
+                arrow_data = pa.array(col_data, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, TypeError):
+                pass
+        
+        if arrow_data is None:
+            arrow_data = pa.array([_as_text(value) for value in col_data], type=pa.string())
+        
+        arrays.append(arrow_data)
+    
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+
+def export_to_parquet(df: pd.DataFrame) -> bytes:
+    """Export DataFrame to zstd-compressed Parquet and return as bytes"""
+    return export_frames_to_parquet([df])
+
+def export_frames_to_parquet(frames: Iterable[pd.DataFrame]) -> bytes:
+    """Export a sequence of DataFrame chunks to one Parquet file and return as bytes
+    
+    Chunks are held as Arrow tables (compact, columnar) until the file is
+    written, so column types can be unified across them. Raises ImportError
+    when pyarrow is not installed.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    tables = [_arrow_table(df) for df in frames]
+    table = pa.concat_tables(tables, promote_options='permissive') if tables else pa.table({})
+    
+    output = io.BytesIO()
+    pq.write_table(table, output, compression='zstd')
+    return output.getvalue()
+
+_DANGEROUS_SQL_KEYWORDS = re.compile(
+    r'\b(?:DROP|DELETE|TRUNCATE|ALTER|CREATE|INSERT|UPDATE|GRANT|REVOKE)\b',
+    re.IGNORECASE
+)
+
+def validate_sql_query(query: str) -> bool:
+    """Basic SQL query validation (prevent dangerous operations)"""
+    return _DANGEROUS_SQL_KEYWORDS.search(query) is None
 
 def format_data_type(data_type: str, max_length: int = None, precision: int = None, scale: int = None) -> str:
     """Format data type with additional information"""
@@ -99,6 +336,45 @@ def format_data_type(data_type: str, max_length: int = None, precision: int = No
     
     return formatted_type
 
+NUMERIC_DATA_TYPES = {'smallint', 'integer', 'bigint', 'numeric', 'decimal', 'real', 'double precision'}
+
+TEXT_DATA_TYPES = {'text', 'character varying', 'varchar', 'character', 'char', 'citext'}
+
+def is_numeric_data_type(data_type: str) -> bool:
+    """Check whether a PostgreSQL data type is numeric"""
+    return data_type.lower() in NUMERIC_DATA_TYPES
+
+def is_text_data_type(data_type: str) -> bool:
+    """Check whether a PostgreSQL data type is a string type"""
+    return data_type.lower() in TEXT_DATA_TYPES
+
+def downcast_dataframe(df: pd.DataFrame, max_unique_ratio: float = 0.5) -> pd.DataFrame:
+    """Shrink a DataFrame's memory by using category and smaller integer dtypes
+    
+    Only lossless conversions are made: low-cardinality string columns become
+    categories and integer columns the smallest integer type that fits.
+    Arrow-backed columns (see to_arrow_dtypes) are left alone; their strings
+    are already compact, and categories of them would only add a copy.
+    """
+    df = df.copy()
+    
+    for column in df.columns:
+        col_data = df[column]
+        
+        if isinstance(col_data.dtype, pd.ArrowDtype) or getattr(col_data.dtype, 'storage', None) == 'pyarrow':
+            continue
+        
+        if pd.api.types.is_integer_dtype(col_data):
+            df[column] = pd.to_numeric(col_data, downcast='integer')
+        elif (
+            (col_data.dtype == object or pd.api.types.is_string_dtype(col_data))
+            and pd.api.types.infer_dtype(col_data, skipna=True) == 'string'
+            and col_data.nunique() < len(col_data) * max_unique_ratio
+        ):
+            df[column] = col_data.astype('category')
+    
+    return df
+
 def create_data_summary(df: pd.DataFrame) -> Dict[str, Any]:
     """Create a comprehensive summary of the DataFrame"""
     summary = {
@@ -114,13 +390,6 @@ def create_data_summary(df: pd.DataFrame) -> Dict[str, Any]:
     
     return summary
 
-def paginate_dataframe(df: pd.DataFrame, page_size: int, page_number: int) -> pd.DataFrame:
-    """Paginate a DataFrame"""
-    start_idx = (page_number - 1) * page_size
-    end_idx = start_idx + page_size
-    
-    return df.iloc[start_idx:end_idx]
-
 def search_dataframe(df: pd.DataFrame, search_term: str, columns: List[str] = None) -> pd.DataFrame:
     """Search for a term across specified columns or all columns"""
     if not search_term:
@@ -129,14 +398,18 @@ def search_dataframe(df: pd.DataFrame, search_term: str, columns: List[str] = No
     if columns is None:
         columns = df.columns.tolist()
     
-    # Create a mask for rows that contain the search term
-    mask = pd.Series([False] * len(df), index=df.index)
+    columns = [col for col in columns if col in df.columns]
+    if df.empty or not columns:
+        return df.iloc[0:0]
     
-    for col in columns:
-        if col in df.columns:
-            # Convert to string and search (case-insensitive)
-            col_mask = df[col].astype(str).str.contains(search_term, case=False, na=False)
-            mask = mask | col_mask
+    # Join the columns into one string per row with a unit separator, so a
+    # single case-insensitive substring scan covers every column. Missing
+    # values are blanked before stringifying so they don't match "nan"; the
+    # object cast lets '' replace them in numeric, datetime and Arrow columns
+    selected = df[columns]
+    text = selected.astype(object).where(selected.notna(), '').astype(str)
+    joined = text.iloc[:, 0].str.cat([text.iloc[:, i] for i in range(1, text.shape[1])], sep='\x1f')
+    mask = joined.str.contains(search_term, case=False, regex=False, na=False)
     
     return df[mask]
 